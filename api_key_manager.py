@@ -1,6 +1,7 @@
 import asyncio
 import time
-from typing import Dict, List, Optional
+from collections import deque
+from typing import Deque, Dict, List, Optional
 from dataclasses import dataclass
 import logging
 
@@ -15,9 +16,16 @@ class KeyState:
     rate_limited_until: float = 0.0  # Unix timestamp when rate limit expires
     error_count: int = 0
 
-    def is_available(self) -> bool:
-        """Check if the key is available (not rate-limited)."""
-        return time.time() >= self.rate_limited_until
+    def is_available(self, now: Optional[float] = None) -> bool:
+        """
+        Check if the key is available (not rate-limited).
+
+        Args:
+            now: Current Unix timestamp, to share one clock read across several checks.
+        """
+        if now is None:
+            now = time.time()
+        return now >= self.rate_limited_until
 
 
 class ApiKeyManager:
@@ -44,11 +52,16 @@ class ApiKeyManager:
             for key_name, key_value in keys.items()
         ]
 
-        # Current key index
-        self._current_index: int = 0
+        # Lookup from API key value to its state for O(1) access
+        self._key_by_value: Dict[str, KeyState] = {}
+        for state in self._key_states:
+            self._key_by_value.setdefault(state.key, state)
+
+        # Preformatted Authorization header values, so retries do not rebuild them
+        self._bearers: Dict[str, str] = {state.key: f"Bearer {state.key}" for state in self._key_states}
 
-        # Lock to ensure thread-safe access
-        self._lock: asyncio.Lock = asyncio.Lock()
+        # Rotation order; the head of the deque is the current key
+        self._rotation: Deque[KeyState] = deque(self._key_states)
 
         # Cooldown period after rate limiting
         self._cooldown_seconds: int = cooldown_seconds
@@ -64,33 +77,34 @@ class ApiKeyManager:
         Returns:
             The current API key.
         """
-        async with self._lock:
-            # Try to find an available key starting from current index
-            for _ in range(len(self._key_states)):
-                current_state = self._key_states[self._current_index]
+        # No lock is needed: key state is only touched from the event loop and
+        # nothing awaits between reading and updating it, so waiting requests
+        # never hold up others behind the cooldown sleep.
+        while True:
+            now = time.time()
+
+            # Try to find an available key starting from the current one
+            for _ in range(len(self._rotation)):
+                current_state = self._rotation[0]
 
-                if current_state.is_available():
+                if current_state.is_available(now):
                     logger.debug(f"Using key '{current_state.name}'")
                     return current_state.key
 
                 # This key is rate-limited, try next one
                 logger.info(f"Key '{current_state.name}' is rate-limited, trying next...")
-                self._current_index = (self._current_index + 1) % len(self._key_states)
-
-            # All keys are rate-limited - find the one that will be available soonest
-            soonest_available = min(self._key_states,
-                                   key=lambda k: k.rate_limited_until)
-            wait_time = soonest_available.rate_limited_until - time.time()
+                self._rotation.rotate(-1)
 
-            if wait_time > 0:
-                logger.warning(f"All keys rate-limited. Waiting {wait_time:.1f}s for "
-                             f"key '{soonest_available.name}' to become available...")
-                await asyncio.sleep(wait_time)
+            # All keys are rate-limited - wait for the one that will be available soonest
+            soonest_available = min(self._rotation, key=lambda k: k.rate_limited_until)
+            wait_time = soonest_available.rate_limited_until - now
+            logger.warning(f"All keys rate-limited. Waiting {wait_time:.1f}s for "
+                         f"key '{soonest_available.name}' to become available...")
+            await asyncio.sleep(wait_time)
 
-                # Update current index to the newly available key
-                self._current_index = self._key_states.index(soonest_available)
-
-            return self._key_states[self._current_index].key
+            # Make the newly available key the current one; the loop re-checks it
+            # in case another request rate-limited it again while we waited
+            self._rotation.rotate(-self._rotation.index(soonest_available))
 
     async def mark_key_rate_limited(self, api_key: str) -> None:
         """
@@ -99,21 +113,18 @@ class ApiKeyManager:
         Args:
             api_key: The API key that received a rate limit error.
         """
-        async with self._lock:
-            # Find the key state
-            for state in self._key_states:
-                if state.key == api_key:
-                    state.rate_limited_until = time.time() + self._cooldown_seconds
-                    state.error_count += 1
-                    logger.warning(f"Key '{state.name}' rate-limited until "
-                                 f"{time.strftime('%H:%M:%S', time.localtime(state.rate_limited_until))} "
-                                 f"(error count: {state.error_count})")
-
-                    # Rotate to next key
-                    self._current_index = (self._current_index + 1) % len(self._key_states)
-                    next_key = self._key_states[self._current_index]
-                    logger.info(f"Rotating to key '{next_key.name}'")
-                    break
+        state = self._key_by_value.get(api_key)
+        if state is not None:
+            state.rate_limited_until = time.time() + self._cooldown_seconds
+            state.error_count += 1
+            logger.warning(f"Key '{state.name}' rate-limited until "
+                         f"{time.strftime('%H:%M:%S', time.localtime(state.rate_limited_until))} "
+                         f"(error count: {state.error_count})")
+
+            # Rotate to next key, unless a concurrent request already moved past this one
+            if self._rotation[0] is state:
+                self._rotation.rotate(-1)
+                logger.info(f"Rotating to key '{self._rotation[0].name}'")
 
     async def mark_key_success(self, api_key: str) -> None:
         """
@@ -122,13 +133,24 @@ class ApiKeyManager:
         Args:
             api_key: The API key that was used successfully.
         """
-        async with self._lock:
-            for state in self._key_states:
-                if state.key == api_key:
-                    if state.error_count > 0:
-                        logger.info(f"Key '{state.name}' recovered (was {state.error_count} errors)")
-                    state.error_count = 0
-                    break
+        state = self._key_by_value.get(api_key)
+        if state is not None:
+            if state.error_count > 0:
+                logger.info(f"Key '{state.name}' recovered (was {state.error_count} errors)")
+            state.error_count = 0
+
+    def bearer_for(self, api_key: str) -> str:
+        """
+        Gets the Authorization header value for an API key.
+
+        Args:
+            api_key: An API key returned by get_current_key().
+
+        Returns:
+            The "Bearer <key>" header value.
+        """
+        bearer = self._bearers.get(api_key)
+        return bearer if bearer is not None else f"Bearer {api_key}"
 
     def get_key_count(self) -> int:
         """
@@ -146,20 +168,30 @@ class ApiKeyManager:
         Returns:
             Dictionary with key statuses.
         """
-        async with self._lock:
-            now = time.time()
-            return {
-                "keys": [
-                    {
-                        "name": state.name,
-                        "available": state.is_available(),
-                        "rate_limited_for": max(0, state.rate_limited_until - now),
-                        "error_count": state.error_count
-                    }
-                    for state in self._key_states
-                ],
-                "current_key": self._key_states[self._current_index].name
-            }
+        now = time.time()
+        return {
+            "keys": [
+                {
+                    "name": state.name,
+                    "available": state.is_available(now),
+                    "rate_limited_for": max(0, state.rate_limited_until - now),
+                    "error_count": state.error_count
+                }
+                for state in self._key_states
+            ],
+            "current_key": self._rotation[0].name
+        }
+
+    def seconds_until_available(self) -> float:
+        """
+        Gets how long get_current_key() would currently wait for a key.
+
+        Returns:
+            0.0 if a key is available now, otherwise the seconds until the
+            soonest rate-limited key becomes available.
+        """
+        now = time.time()
+        return max(0.0, min(state.rate_limited_until for state in self._key_states) - now)
 
     async def all_keys_rate_limited(self) -> bool:
         """
@@ -168,5 +200,5 @@ class ApiKeyManager:
         Returns:
             True if all keys are rate-limited, False otherwise.
         """
-        async with self._lock:
-            return all(not state.is_available() for state in self._key_states)
\ No newline at end of file
+        now = time.time()
+        return all(not state.is_available(now) for state in self._key_states)
\ No newline at end of file
@@ -1,12 +1,45 @@
 import sqlite3
 import secrets
 import logging
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on regenerating a key after a (practically impossible) collision
+_MAX_KEY_GENERATION_ATTEMPTS = 5
+
+# Statements on the request path, kept as constants so every call passes the
+# identical string and hits the connection's prepared statement cache
+_SQL_LOAD_KEYS = "SELECT api_key, id, revoked FROM api_keys"
+_SQL_VERIFY_KEY = "SELECT id, revoked FROM api_keys WHERE api_key = ?"
+_SQL_FLUSH_USAGE = """
+    UPDATE api_keys
+    SET request_count = request_count + ?, last_used_at = ?
+    WHERE id = ?
+"""
+
+# (unix second, formatted "YYYY-MM-DDTHH:MM:SS") of the last timestamp produced
+_last_iso_second: Tuple[int, str] = (-1, "")
+
+
+def _utcnow_iso() -> str:
+    """
+    Return the current UTC time in the same ISO 8601 format as
+    datetime.utcnow().isoformat(). The date/time part is only reformatted
+    when the second changes; only the microseconds are formatted per call.
+    """
+    global _last_iso_second
+    now = time.time()
+    second = int(now)
+    cached_second, prefix = _last_iso_second
+    if second != cached_second:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _last_iso_second = (second, prefix)
+    return f"{prefix}.{int((now - second) * 1_000_000):06d}"
+
 
 class IncomingKeyManager:
     """
@@ -14,10 +47,131 @@ class IncomingKeyManager:
     Provides methods to create, revoke, and verify API keys.
     """
 
-    def __init__(self, db_path: str = "./data/incoming_keys.db"):
+    def __init__(self, db_path: str = "./data/incoming_keys.db", cache_ttl: float = 30.0,
+                 flush_interval: float = 5.0, flush_threshold: int = 100, inline_flush: bool = True):
+        """
+        Args:
+            db_path: Path to the SQLite database file
+            cache_ttl: Seconds before the in-memory key cache is reloaded, so that
+                revocations made by other processes (e.g. manage_keys.py) are picked up
+            flush_interval: Maximum seconds buffered usage stats are kept in memory
+            flush_threshold: Number of buffered requests that triggers a flush
+            inline_flush: Whether verify_api_key flushes buffered usage itself once
+                flush_threshold or flush_interval is reached; set to False when a
+                background task calls flush_usage instead, to keep writes off the caller
+        """
         # Convert to absolute path and ensure it's a Path object
         self.db_path = str(Path(db_path).resolve())
+        # Single long-lived connection shared by all methods; the lock
+        # serializes access since sqlite3 connections are not thread-safe
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # flush_usage writes on its own connection under its own lock, so a write that waits
+        # for another process's write lock never holds up verify_api_key
+        self._flush_lock = threading.Lock()
+        self._flush_conn: Optional[sqlite3.Connection] = None
+
+        # In-memory view of api_key -> (id, revoked) used by verify_api_key
+        self._key_cache: Dict[str, Tuple[int, bool]] = {}
+        self._cache_ttl = cache_ttl
+        self._cache_loaded_at = 0.0
+
+        # Buffered usage stats: id -> (request count, last_used_at)
+        self._pending_usage: Dict[int, Tuple[int, str]] = {}
+        self._pending_requests = 0
+        self._flush_interval = flush_interval
+        self._flush_threshold = flush_threshold
+        self.inline_flush = inline_flush
+        self._last_flush = time.time()
+
         self._init_database()
+        with self._lock:
+            self._load_key_cache()
+
+    def close(self):
+        """Flush buffered usage stats and close the database connections."""
+        self.flush_usage()
+        with self._flush_lock:
+            if self._flush_conn is not None:
+                self._flush_conn.close()
+                self._flush_conn = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _load_key_cache(self):
+        """Reload the api_key -> (id, revoked) cache. Caller must hold the lock."""
+        cursor = self._conn.cursor()
+        cursor.execute(_SQL_LOAD_KEYS)
+        self._key_cache = {row[0]: (row[1], bool(row[2])) for row in cursor.fetchall()}
+        self._cache_loaded_at = time.time()
+
+    def _take_pending_usage(self) -> List[Tuple[int, str, int]]:
+        """Swap out buffered usage stats as _SQL_FLUSH_USAGE rows. Caller must hold the lock."""
+        rows = [(count, last_used_at, key_id)
+                for key_id, (count, last_used_at) in self._pending_usage.items()]
+        self._pending_usage = {}
+        self._pending_requests = 0
+        self._last_flush = time.time()
+        return rows
+
+    def _restore_pending_usage(self, rows: List[Tuple[int, str, int]]):
+        """Merge rows that failed to be written back into the buffer. Caller must hold the lock."""
+        for count, last_used_at, key_id in rows:
+            # Usage buffered since the swap is newer, so its last_used_at wins
+            newer_count, newer_last_used_at = self._pending_usage.get(key_id, (0, last_used_at))
+            self._pending_usage[key_id] = (count + newer_count, newer_last_used_at)
+
+    def _write_usage(self, conn: sqlite3.Connection, rows: List[Tuple[int, str, int]]):
+        """Apply _SQL_FLUSH_USAGE rows on the given connection."""
+        # One transaction for the whole batch: a single commit instead of one per row
+        with conn:
+            conn.executemany(_SQL_FLUSH_USAGE, rows)
+
+    def _flush_usage(self):
+        """Write buffered usage stats on the shared connection. Caller must hold the lock."""
+        rows = self._take_pending_usage()
+        if rows:
+            try:
+                self._write_usage(self._conn, rows)
+            except Exception:
+                self._restore_pending_usage(rows)
+                raise
+
+    @property
+    def flush_interval(self) -> float:
+        """Maximum seconds buffered usage stats are kept in memory."""
+        return self._flush_interval
+
+    def flush_usage(self):
+        """
+        Write buffered usage stats (request_count, last_used_at) to the database.
+
+        Only swapping out the buffer takes the lock that verify_api_key uses; the
+        write itself runs on a separate connection, so lookups never wait for it.
+        Stats that fail to be written are put back into the buffer.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows = self._take_pending_usage()
+            if not rows:
+                return
+            try:
+                if self._flush_conn is None:
+                    self._flush_conn = self._connect()
+                self._write_usage(self._flush_conn, rows)
+            except Exception:
+                with self._lock:
+                    self._restore_pending_usage(rows)
+                raise
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the database, usable from any thread."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        # synchronous=NORMAL avoids an fsync on every commit in WAL mode
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
 
     def _init_database(self):
         """Initialize the SQLite database with the api_keys table."""
@@ -27,8 +181,12 @@ class IncomingKeyManager:
             logger.info(f"Creating database directory: {db_dir}")
             db_dir.mkdir(parents=True, exist_ok=True)
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self._conn = self._connect()
+        cursor = self._conn.cursor()
+
+        # WAL lets readers proceed concurrently with the writer
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
 
         # Create table if it doesn't exist
         cursor.execute("""
@@ -44,8 +202,12 @@ class IncomingKeyManager:
             )
         """)
 
-        conn.commit()
-        conn.close()
+        # api_key is UNIQUE and therefore already indexed; name and revoked
+        # are used by the *_by_name lookups and get_stats respectively
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_api_keys_name ON api_keys(name)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_api_keys_revoked ON api_keys(revoked)")
+
+        self._conn.commit()
         logger.info(f"Initialized incoming API key database at {self.db_path}")
 
     def generate_api_key(self, name: str) -> str:
@@ -58,72 +220,83 @@ class IncomingKeyManager:
         Returns:
             The generated API key
         """
-        # Generate a secure random API key (32 bytes = 64 hex characters)
-        api_key = f"sk-{secrets.token_urlsafe(32)}"
-        created_at = datetime.utcnow().isoformat()
-
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-                INSERT INTO api_keys (api_key, name, created_at)
-                VALUES (?, ?, ?)
-            """, (api_key, name, created_at))
-            conn.commit()
-            logger.info(f"Generated new API key: {name}")
-            return api_key
-        except sqlite3.IntegrityError:
-            # Very unlikely with secure random, but handle it anyway
-            logger.error("API key collision detected, regenerating...")
-            return self.generate_api_key(name)
-        finally:
-            conn.close()
-
-    def verify_api_key(self, api_key: str) -> bool:
+        created_at = _utcnow_iso()
+
+        with self._lock:
+            cursor = self._conn.cursor()
+            for _ in range(_MAX_KEY_GENERATION_ATTEMPTS):
+                # Generate a secure random API key (32 random bytes, URL-safe base64)
+                api_key = "sk-" + secrets.token_urlsafe(32)
+                try:
+                    cursor.execute("""
+                        INSERT INTO api_keys (api_key, name, created_at)
+                        VALUES (?, ?, ?)
+                    """, (api_key, name, created_at))
+                    self._conn.commit()
+                except sqlite3.IntegrityError:
+                    # Very unlikely with secure random, but handle it anyway
+                    logger.error("API key collision detected, regenerating...")
+                    continue
+                self._key_cache[api_key] = (cursor.lastrowid, False)
+                logger.info(f"Generated new API key: {name}")
+                return api_key
+
+        raise RuntimeError(f"Failed to generate a unique API key after "
+                           f"{_MAX_KEY_GENERATION_ATTEMPTS} attempts")
+
+    def verify_api_key(self, api_key: str, update_usage: bool = True) -> bool:
         """
         Verify if an API key is valid and not revoked.
-        Also updates last_used_at and increments request_count.
+        Also updates last_used_at and increments request_count. Lookups are
+        served from an in-memory cache and usage stats are buffered and
+        written in batches (see flush_usage).
 
         Args:
             api_key: The API key to verify
+            update_usage: Whether to record this call in last_used_at/request_count;
+                pass False for read-only checks
 
         Returns:
             True if valid and not revoked, False otherwise
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._lock:
+            now = time.time()
+            if now - self._cache_loaded_at >= self._cache_ttl:
+                self._load_key_cache()
 
-        try:
-            # Check if key exists and is not revoked
-            cursor.execute("""
-                SELECT id, revoked FROM api_keys
-                WHERE api_key = ?
-            """, (api_key,))
+            entry = self._key_cache.get(api_key)
+            if entry is None:
+                # Not cached - the key may have been added by another process
+                cursor = self._conn.cursor()
+                cursor.execute(_SQL_VERIFY_KEY, (api_key,))
 
-            result = cursor.fetchone()
+                result = cursor.fetchone()
 
-            if result is None:
-                logger.warning(f"Invalid API key attempted: {api_key[:10]}...")
-                return False
+                if result is None:
+                    logger.warning(f"Invalid API key attempted: {api_key[:10]}...")
+                    return False
 
-            key_id, revoked = result
+                entry = (result[0], bool(result[1]))
+                self._key_cache[api_key] = entry
+
+            key_id, revoked = entry
 
             if revoked:
                 logger.warning(f"Revoked API key attempted: {api_key[:10]}...")
                 return False
 
-            # Update last_used_at and request_count
-            cursor.execute("""
-                UPDATE api_keys
-                SET last_used_at = ?, request_count = request_count + 1
-                WHERE id = ?
-            """, (datetime.utcnow().isoformat(), key_id))
+            if not update_usage:
+                return True
 
-            conn.commit()
+            # Buffer last_used_at and request_count update
+            count = self._pending_usage.get(key_id, (0, None))[0]
+            self._pending_usage[key_id] = (count + 1, _utcnow_iso())
+            self._pending_requests += 1
+
+            if self.inline_flush and (self._pending_requests >= self._flush_threshold
+                                      or now - self._last_flush >= self._flush_interval):
+                self._flush_usage()
             return True
-        finally:
-            conn.close()
 
     def revoke_api_key(self, api_key: str) -> bool:
         """
@@ -135,26 +308,23 @@ class IncomingKeyManager:
         Returns:
             True if successfully revoked, False if key doesn't exist
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        with self._lock:
+            cursor = self._conn.cursor()
             cursor.execute("""
                 UPDATE api_keys
                 SET revoked = 1, revoked_at = ?
                 WHERE api_key = ? AND revoked = 0
-            """, (datetime.utcnow().isoformat(), api_key))
+            """, (_utcnow_iso(), api_key))
 
-            conn.commit()
+            self._conn.commit()
 
             if cursor.rowcount > 0:
+                self._load_key_cache()
                 logger.info(f"Revoked API key: {api_key[:10]}...")
                 return True
             else:
                 logger.warning(f"Attempted to revoke non-existent or already revoked key")
                 return False
-        finally:
-            conn.close()
 
     def revoke_by_id(self, key_id: int) -> bool:
         """
@@ -166,26 +336,23 @@ class IncomingKeyManager:
         Returns:
             True if successfully revoked, False if key doesn't exist
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        with self._lock:
+            cursor = self._conn.cursor()
             cursor.execute("""
                 UPDATE api_keys
                 SET revoked = 1, revoked_at = ?
                 WHERE id = ? AND revoked = 0
-            """, (datetime.utcnow().isoformat(), key_id))
+            """, (_utcnow_iso(), key_id))
 
-            conn.commit()
+            self._conn.commit()
 
             if cursor.rowcount > 0:
+                self._load_key_cache()
                 logger.info(f"Revoked API key by ID: {key_id}")
                 return True
             else:
                 logger.warning(f"Attempted to revoke non-existent or already revoked key with ID: {key_id}")
                 return False
-        finally:
-            conn.close()
 
     def revoke_by_name(self, name: str) -> bool:
         """
@@ -197,26 +364,23 @@ class IncomingKeyManager:
         Returns:
             True if successfully revoked, False if key doesn't exist
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        with self._lock:
+            cursor = self._conn.cursor()
             cursor.execute("""
                 UPDATE api_keys
                 SET revoked = 1, revoked_at = ?
                 WHERE name = ? AND revoked = 0
-            """, (datetime.utcnow().isoformat(), name))
+            """, (_utcnow_iso(), name))
 
-            conn.commit()
+            self._conn.commit()
 
             if cursor.rowcount > 0:
+                self._load_key_cache()
                 logger.info(f"Revoked API key by name: {name}")
                 return True
             else:
                 logger.warning(f"Attempted to revoke non-existent or already revoked key with name: {name}")
                 return False
-        finally:
-            conn.close()
 
     def enable_api_key(self, api_key: str) -> bool:
         """
@@ -228,26 +392,23 @@ class IncomingKeyManager:
         Returns:
             True if successfully enabled, False if key doesn't exist or not revoked
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        with self._lock:
+            cursor = self._conn.cursor()
             cursor.execute("""
                 UPDATE api_keys
                 SET revoked = 0, revoked_at = NULL
                 WHERE api_key = ? AND revoked = 1
             """, (api_key,))
 
-            conn.commit()
+            self._conn.commit()
 
             if cursor.rowcount > 0:
+                self._load_key_cache()
                 logger.info(f"Enabled API key: {api_key[:10]}...")
                 return True
             else:
                 logger.warning(f"Attempted to enable non-existent or already active key")
                 return False
-        finally:
-            conn.close()
 
     def enable_by_id(self, key_id: int) -> bool:
         """
@@ -259,26 +420,23 @@ class IncomingKeyManager:
         Returns:
             True if successfully enabled, False if key doesn't exist or not revoked
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        with self._lock:
+            cursor = self._conn.cursor()
             cursor.execute("""
                 UPDATE api_keys
                 SET revoked = 0, revoked_at = NULL
                 WHERE id = ? AND revoked = 1
             """, (key_id,))
 
-            conn.commit()
+            self._conn.commit()
 
             if cursor.rowcount > 0:
+                self._load_key_cache()
                 logger.info(f"Enabled API key by ID: {key_id}")
                 return True
             else:
                 logger.warning(f"Attempted to enable non-existent or already active key with ID: {key_id}")
                 return False
-        finally:
-            conn.close()
 
     def enable_by_name(self, name: str) -> bool:
         """
@@ -290,26 +448,23 @@ class IncomingKeyManager:
         Returns:
             True if successfully enabled, False if key doesn't exist or not revoked
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        with self._lock:
+            cursor = self._conn.cursor()
             cursor.execute("""
                 UPDATE api_keys
                 SET revoked = 0, revoked_at = NULL
                 WHERE name = ? AND revoked = 1
             """, (name,))
 
-            conn.commit()
+            self._conn.commit()
 
             if cursor.rowcount > 0:
+                self._load_key_cache()
                 logger.info(f"Enabled API key by name: {name}")
                 return True
             else:
                 logger.warning(f"Attempted to enable non-existent or already active key with name: {name}")
                 return False
-        finally:
-            conn.close()
 
     def list_api_keys(self) -> List[Dict[str, Any]]:
         """
@@ -318,10 +473,9 @@ class IncomingKeyManager:
         Returns:
             List of dictionaries containing API key information
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
+        self.flush_usage()
+        with self._lock:
+            cursor = self._conn.cursor()
             cursor.execute("""
                 SELECT id, api_key, name, created_at, revoked, revoked_at,
                        last_used_at, request_count
@@ -345,8 +499,6 @@ class IncomingKeyManager:
                 })
 
             return keys
-        finally:
-            conn.close()
 
     def get_stats(self) -> Dict[str, int]:
         """
@@ -355,23 +507,15 @@ class IncomingKeyManager:
         Returns:
             Dictionary with total, active, and revoked counts
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("SELECT COUNT(*) FROM api_keys")
-            total = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM api_keys WHERE revoked = 0")
-            active = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM api_keys WHERE revoked = 1")
-            revoked = cursor.fetchone()[0]
+        with self._lock:
+            cursor = self._conn.cursor()
+            # revoked is always 0 or 1, so SUM(revoked) counts revoked keys
+            cursor.execute("SELECT COUNT(*), COALESCE(SUM(revoked), 0) FROM api_keys")
+            total, revoked = cursor.fetchone()
+            active = total - revoked
 
             return {
                 "total": total,
                 "active": active,
                 "revoked": revoked
             }
-        finally:
-            conn.close()
@@ -38,18 +38,22 @@ def cmd_list(args):
         print("\nNo API keys found.\n")
         return
 
-    print("\n" + "=" * 120)
-    print(f"{'ID':<4} {'Name':<20} {'API Key':<45} {'Status':<10} {'Requests':<10} {'Last Used':<25}")
-    print("=" * 120)
+    lines = [
+        "\n" + "=" * 120,
+        f"{'ID':<4} {'Name':<20} {'API Key':<45} {'Status':<10} {'Requests':<10} {'Last Used':<25}",
+        "=" * 120,
+    ]
 
     for key in keys:
         status = "REVOKED" if key['revoked'] else "ACTIVE"
         api_key_display = key['api_key'][:40] + "..." if len(key['api_key']) > 40 else key['api_key']
         last_used = format_timestamp(key['last_used_at'])
 
-        print(f"{key['id']:<4} {key['name']:<20} {api_key_display:<45} {status:<10} {key['request_count']:<10} {last_used:<25}")
+        lines.append(f"{key['id']:<4} {key['name']:<20} {api_key_display:<45} {status:<10} {key['request_count']:<10} {last_used:<25}")
 
-    print("=" * 120)
+    lines.append("=" * 120)
+    # Build the table once and write it in a single call
+    print("\n".join(lines))
 
     stats = manager.get_stats()
     print(f"\nTotal: {stats['total']} | Active: {stats['active']} | Revoked: {stats['revoked']}\n")
@@ -1,14 +1,20 @@
 import os
 import json
 import asyncio
+import base64
 import aiohttp
+import orjson
 from aiohttp import web
+from multidict import CIMultiDict
 import logging
-from typing import Dict, Any, List
+import math
+import signal
+from typing import Dict, Any, List, Mapping, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-import uuid
-import copy
+import time
 
 from api_key_manager import ApiKeyManager
 from incoming_key_manager import IncomingKeyManager
@@ -36,11 +42,115 @@ BYTES_PER_TOKEN = 4.7
 CONTENT_LENGTH_THRESHOLD = int(TOKEN_THRESHOLD * BYTES_PER_TOKEN)
 
 # Error codes that trigger key rotation
-ROTATE_KEY_ERROR_CODES = {429, 500}
+ROTATE_KEY_ERROR_CODES = frozenset({429, 500})
+
+# Pre-encoded JSON bodies for rejected incoming requests
+AUTH_ERROR_MISSING_HEADER = b'{"error": {"message": "Missing Authorization header", "type": "invalid_request_error", "code": "missing_authorization"}}'
+AUTH_ERROR_INVALID_FORMAT = b'{"error": {"message": "Invalid Authorization header format", "type": "invalid_request_error", "code": "invalid_authorization"}}'
+AUTH_ERROR_INVALID_KEY = b'{"error": {"message": "Invalid API key", "type": "invalid_request_error", "code": "invalid_api_key"}}'
+
+# Pre-encoded plain-text bodies for the proxy's own fixed upstream failures
+ERROR_NO_ALTERNATIVE_APIS = b"No alternative APIs configured"
+ERROR_KEYS_RATE_LIMITED = b"Service unavailable: all API keys are rate-limited."
+ERROR_MAX_RETRIES = b"Service unavailable: Maximum retries exceeded."
+
+# Headers not forwarded upstream (compared lowercased); auth and body framing are set per request
+STRIPPED_REQUEST_HEADERS = frozenset({'authorization', 'host', 'content-length', 'transfer-encoding'})
+# Headers not copied from upstream responses, since aiohttp recomputes them for the client
+STRIPPED_RESPONSE_HEADERS = frozenset({'content-length', 'transfer-encoding', 'content-encoding'})
+
+# Content types whose bodies are logged as text rather than base64 (JSON types are matched separately)
+TEXT_CONTENT_TYPE_PREFIXES = ('text/', 'application/x-www-form-urlencoded')
+
+# Request bodies of at least this many bytes (or chunked bodies) on non-chat endpoints
+# are streamed upstream instead of buffered; streamed requests are sent only once
+STREAM_REQUEST_BODY_THRESHOLD = 1024 * 1024
+
+# Largest chunk read from an upstream stream before it is forwarded to the client
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Byte strings probed for in upstream bodies before they are parsed for the errors they signal
+CONTEXT_LENGTH_ERROR_MARKER = b'context_length_exceeded'
+QUOTA_ERROR_MARKER = b'token quota is not enough'
+
+# Successful JSON responses up to this many bytes are buffered and checked for embedded
+# quota errors; larger ones are streamed, since those error responses are always short
+INSPECT_RESPONSE_BODY_LIMIT = 64 * 1024
+
+# Discarded error responses up to this many bytes are read to the end so their keep-alive
+# connection returns to the pool; larger or unsized ones are dropped with their connection
+DRAIN_RESPONSE_BODY_LIMIT = 64 * 1024
+
+# Upstream connection pool sizing
+UPSTREAM_CONNECTION_LIMIT = 1000
+UPSTREAM_CONNECTION_LIMIT_PER_HOST = 100
+# Upstream timeouts in seconds; connect is bounded tightly so a dead host fails over quickly.
+# The read timeout bounds the silence between reads, not the whole response, so long
+# streamed generations are not cut off while tokens keep arriving.
+UPSTREAM_READ_TIMEOUT = 300
+UPSTREAM_CONNECT_TIMEOUT = 10
 
 # Request/Response logging configuration
 LOG_REQUESTS_ENABLED = os.environ.get("LOG_REQUESTS", "true").lower() == "true"
 LOG_DIR = os.environ.get("LOG_DIR", "./logs")
+# Maximum number of log entries waiting to be written before new ones are dropped
+LOG_QUEUE_SIZE = 10000
+# Maximum number of log entries written per batch
+LOG_BATCH_SIZE = 100
+# Streamed response bodies are captured for the log only up to this many bytes
+LOG_MAX_BODY_BYTES = 4 * 1024 * 1024
+# Emit one warning per this many dropped log entries
+LOG_DROP_WARNING_INTERVAL = 1000
+
+
+def _json_loads(data: Union[bytes, str]) -> Any:
+    """
+    Parse a JSON body with orjson, falling back to the stdlib parser for
+    input orjson rejects but json accepts (e.g. lone surrogate escapes).
+
+    orjson does not reject integers beyond 64 bits: it parses them as floats,
+    losing precision. Results that are re-serialized and sent on must be
+    parsed with json.loads instead, which keeps them exact.
+
+    Raises:
+        json.JSONDecodeError: If the body is not valid JSON.
+    """
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    """
+    Serialize to compact UTF-8 JSON with orjson, falling back to the stdlib
+    encoder for values orjson rejects (e.g. integers beyond 64 bits).
+    """
+    try:
+        return orjson.dumps(obj)
+    except orjson.JSONEncodeError:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def _make_failed_tool_response(tool_call_id: str) -> Dict[str, Any]:
+    """Build the fake tool message injected for a tool_call that never got a response."""
+    return {
+        "role": "tool",
+        "tool_call_id": tool_call_id,
+        "content": "failed"
+    }
+
+
+@dataclass(frozen=True)
+class AlternativeRoute:
+    """A client request prepared for re-sending to the alternative APIs."""
+    request: web.Request  # The client request, used for its method and to stream the response
+    request_data: Dict[str, Any]  # The parsed (possibly tool-call fixed) request
+    path: str
+    original_headers: Mapping[str, str]
+    start_time: float
+    original_request_body: bytes  # The body as received, for the request log
+    request_body: Optional[bytes] = None  # Serialized request_data, sent as is when the model needs no change
 
 
 class ProxyServer:
@@ -49,24 +159,98 @@ class ProxyServer:
     with round-robin API key rotation.
     """
     def __init__(self, api_key_manager: ApiKeyManager, incoming_key_manager: IncomingKeyManager = None,
-                 synthetic_api_key: str = None, zai_api_key: str = None, fallback_on_cooldown: bool = False):
+                 synthetic_api_key: str = None, zai_api_key: str = None, fallback_on_cooldown: bool = False,
+                 max_key_wait: Optional[float] = None):
         self.api_key_manager = api_key_manager
         self.incoming_key_manager = incoming_key_manager
         self.synthetic_api_key = synthetic_api_key
         self.zai_api_key = zai_api_key
         self.fallback_on_cooldown = fallback_on_cooldown
+        # Longest a request may wait for a rate-limited key before failing fast (None waits out the cooldown)
+        self.max_key_wait = max_key_wait
+        self._usage_flush_task: Optional[asyncio.Task] = None
+        # Shared upstream HTTP session, created on app startup so connections are pooled
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Set by stop() or a termination signal to end run()
+        self._shutdown_event: Optional[asyncio.Event] = None
         self.app = web.Application()
+        self.app.on_startup.append(self._start_session)
+        self.app.on_cleanup.append(self._close_session)
+        if self.incoming_key_manager:
+            self.app.on_startup.append(self._start_usage_flush)
+            self.app.on_cleanup.append(self._stop_usage_flush)
         # Add status endpoint
         self.app.router.add_get("/_status", self.status_handler)
         # Add the catch-all route (must be last)
         self.app.router.add_route("*", "/{path:.*}", self.proxy_handler)
 
-        # Create logs directory if logging is enabled
+        # Background writer for request/response logs
+        self._log_queue: Optional[asyncio.Queue] = None
+        self._log_writer_task: Optional[asyncio.Task] = None
+        self._log_executor: Optional[ThreadPoolExecutor] = None
+        # Entries dropped because the queue was full
+        self._dropped_log_entries = 0
+        # Current per-date log file, only touched from the log writer thread
+        self._log_fd: Optional[int] = None
+        self._log_file_date: Optional[str] = None
+
+        # Start the log writer and create logs directory if logging is enabled
         if LOG_REQUESTS_ENABLED:
+            self.app.on_startup.append(self._start_log_writer)
+            self.app.on_cleanup.append(self._stop_log_writer)
             Path(LOG_DIR).mkdir(parents=True, exist_ok=True)
-            logger.info(f"Request/Response logging enabled. Logs will be saved to: {LOG_DIR}")
+            logger.info("Request/Response logging enabled. Logs will be saved to: %s", LOG_DIR)
+
+    async def _start_session(self, app: web.Application):
+        """
+        Create the upstream client session. A single long-lived session keeps
+        TCP/TLS connections to the upstream API alive across requests.
+        """
+        connector = aiohttp.TCPConnector(
+            limit=UPSTREAM_CONNECTION_LIMIT,
+            limit_per_host=UPSTREAM_CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=300,
+            keepalive_timeout=75,
+            # Abort TLS connections the peer never finished closing instead of leaking them
+            enable_cleanup_closed=True
+        )
+        timeout = aiohttp.ClientTimeout(total=None, connect=UPSTREAM_CONNECT_TIMEOUT,
+                                        sock_read=UPSTREAM_READ_TIMEOUT)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def _close_session(self, app: web.Application):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def _flush_incoming_key_usage(self):
+        """
+        Periodically write buffered incoming API key usage stats to the database,
+        so they are persisted even when no requests arrive to trigger a flush.
+        The SQLite commit runs in a worker thread, off the event loop.
+        """
+        while True:
+            await asyncio.sleep(self.incoming_key_manager.flush_interval)
+            try:
+                await asyncio.to_thread(self.incoming_key_manager.flush_usage)
+            except Exception as e:
+                logger.error("Failed to flush incoming API key usage: %s", e)
+
+    async def _start_usage_flush(self, app: web.Application):
+        # This task is now the only writer of usage stats; verify_api_key just buffers them
+        self.incoming_key_manager.inline_flush = False
+        self._usage_flush_task = asyncio.create_task(self._flush_incoming_key_usage())
 
-    def _sanitize_headers(self, headers: Dict[str, str]) -> Dict[str, str]:
+    async def _stop_usage_flush(self, app: web.Application):
+        if self._usage_flush_task:
+            self._usage_flush_task.cancel()
+            try:
+                await self._usage_flush_task
+            except asyncio.CancelledError:
+                pass
+        self.incoming_key_manager.close()
+
+    def _sanitize_headers(self, headers: Mapping[str, str]) -> Dict[str, str]:
         """
         Sanitize headers by removing sensitive information like API keys.
         """
@@ -78,73 +262,101 @@ class ProxyServer:
             sanitized['authorization'] = '[REDACTED]'
         return sanitized
 
-    def _fix_missing_tool_responses(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _upstream_headers(self, client_headers: Mapping[str, str]) -> CIMultiDict:
+        """
+        Build the headers forwarded upstream from the client's headers.
+        Authorization, Host and body framing headers are dropped for the
+        caller to set, and the proxy's User-Agent and Accept-Encoding
+        replace the client's.
+
+        Args:
+            client_headers: The incoming request headers.
+
+        Returns:
+            A case-insensitive copy that keeps repeated headers.
+        """
+        headers = CIMultiDict(client_headers)
+        for name in STRIPPED_REQUEST_HEADERS:
+            headers.popall(name, None)
+        headers["User-Agent"] = "Cerebras-Proxy/1.0"
+        # Ask for uncompressed bodies: they are inspected and relayed as is, so a compressed
+        # upstream response would only be decompressed here. Clients get identity bodies anyway.
+        headers["Accept-Encoding"] = "identity"
+        return headers
+
+    def _fix_missing_tool_responses(self, request_data: Dict[str, Any], log: bool = True) -> Dict[str, Any]:
         """
         Validates and fixes messages array to ensure all tool_calls have corresponding tool responses.
         If a tool_call is missing its response, injects a fake "failed" response.
+
+        Args:
+            request_data: The parsed client request.
+            log: Whether to log a warning for each batch of injected responses.
+
+        Returns:
+            request_data itself when nothing needed fixing, otherwise a new dict
+            with the patched messages list.
         """
         # Only process chat completion requests with messages
         if 'messages' not in request_data or not isinstance(request_data['messages'], list):
             return request_data
 
         messages: List[Dict[str, Any]] = request_data['messages']
+
+        # Fast path: without any assistant tool_calls there is nothing to fix
+        if not any(isinstance(msg, dict) and msg.get('role') == 'assistant' and 'tool_calls' in msg
+                   for msg in messages):
+            return request_data
+
         fixed_messages: List[Dict[str, Any]] = []
-        pending_tool_calls: List[str] = []  # Track tool_calls waiting for responses
+        # Track tool_calls waiting for responses; a dict keeps insertion order with O(1) removal
+        pending_tool_calls: Dict[str, None] = {}
 
         for i, msg in enumerate(messages):
-            # Make a copy of the message to avoid modifying original
-            msg_copy = copy.deepcopy(msg)
-
             # Check if this message has tool_calls
-            if msg_copy.get('role') == 'assistant' and 'tool_calls' in msg_copy:
+            if msg.get('role') == 'assistant' and 'tool_calls' in msg:
                 # Add this message
-                fixed_messages.append(msg_copy)
+                fixed_messages.append(msg)
                 # Track all tool_call IDs that need responses
-                for tool_call in msg_copy.get('tool_calls', []):
+                for tool_call in msg.get('tool_calls', []):
                     if 'id' in tool_call:
-                        pending_tool_calls.append(tool_call['id'])
+                        pending_tool_calls[tool_call['id']] = None
                 continue
 
             # Check if this is a tool response
-            if msg_copy.get('role') == 'tool' and 'tool_call_id' in msg_copy:
+            if msg.get('role') == 'tool' and 'tool_call_id' in msg:
                 # Remove this tool_call_id from pending
-                tool_call_id = msg_copy['tool_call_id']
-                if tool_call_id in pending_tool_calls:
-                    pending_tool_calls.remove(tool_call_id)
-                fixed_messages.append(msg_copy)
+                pending_tool_calls.pop(msg['tool_call_id'], None)
+                fixed_messages.append(msg)
                 continue
 
             # If we have pending tool_calls and this is NOT a tool response,
             # inject fake responses for all pending tool_calls
             if pending_tool_calls:
-                logger.warning(f"Found {len(pending_tool_calls)} tool_calls without responses. Injecting fake 'failed' responses.")
-                for tool_call_id in pending_tool_calls:
-                    fake_response = {
-                        "role": "tool",
-                        "tool_call_id": tool_call_id,
-                        "content": "failed"
-                    }
-                    fixed_messages.append(fake_response)
-                    logger.info(f"Injected fake tool response for tool_call_id: {tool_call_id}")
+                if log:
+                    logger.warning("Found %s tool_calls without responses. "
+                                   "Injecting fake 'failed' responses for tool_call_ids: %s",
+                                   len(pending_tool_calls), list(pending_tool_calls))
+                fixed_messages.extend(_make_failed_tool_response(tool_call_id) for tool_call_id in pending_tool_calls)
                 pending_tool_calls.clear()
 
             # Add the current message
-            fixed_messages.append(msg_copy)
+            fixed_messages.append(msg)
 
         # Handle any remaining pending tool_calls at the end
         if pending_tool_calls:
-            logger.warning(f"Found {len(pending_tool_calls)} tool_calls without responses at end of messages. Injecting fake 'failed' responses.")
-            for tool_call_id in pending_tool_calls:
-                fake_response = {
-                    "role": "tool",
-                    "tool_call_id": tool_call_id,
-                    "content": "failed"
-                }
-                fixed_messages.append(fake_response)
-                logger.info(f"Injected fake tool response for tool_call_id: {tool_call_id}")
-
-        # Create a deep copy of request_data and update messages
-        fixed_request_data = copy.deepcopy(request_data)
+            if log:
+                logger.warning("Found %s tool_calls without responses at end of messages. "
+                               "Injecting fake 'failed' responses for tool_call_ids: %s",
+                               len(pending_tool_calls), list(pending_tool_calls))
+            fixed_messages.extend(_make_failed_tool_response(tool_call_id) for tool_call_id in pending_tool_calls)
+
+        if len(fixed_messages) == len(messages):
+            return request_data
+
+        # Messages are never mutated, only new ones appended, so a shallow copy of the
+        # outer dict is enough to leave the caller's request_data untouched
+        fixed_request_data = dict(request_data)
         fixed_request_data['messages'] = fixed_messages
         return fixed_request_data
 
@@ -162,214 +374,465 @@ class ProxyServer:
         if not isinstance(messages, list):
             return False
 
-        for msg in messages:
-            content = msg.get('content')
-            if isinstance(content, list):
-                for item in content:
-                    if isinstance(item, dict) and item.get('type') == 'image_url':
-                        return True
-        return False
+        # Plain string content is skipped without touching its items; stops at the first image
+        return any(
+            isinstance(item, dict) and item.get('type') == 'image_url'
+            for msg in messages if isinstance(msg.get('content'), list)
+            for item in msg['content']
+        )
 
-    async def _route_to_alternative_api(
+    def _fallback_reason(self, status: int, body: bytes) -> Optional[str]:
+        """
+        Check whether a terminal upstream response should be retried on the alternative APIs.
+        Bodies are only parsed when the error marker appears in the raw bytes.
+
+        Args:
+            status: The upstream response status.
+            body: The upstream response body.
+
+        Returns:
+            A description of the error to fail over on, or None to return the response as is.
+        """
+        if status == 503:
+            # Service unavailable
+            return "Service unavailable (503)"
+
+        if status == 400 and CONTEXT_LENGTH_ERROR_MARKER in body:
+            # Check if this is a context_length_exceeded error
+            try:
+                error_data = _json_loads(body)
+                error_code = error_data.get('error', {}).get('code') or error_data.get('code')
+                if error_code == 'context_length_exceeded':
+                    return "Context length exceeded (400)"
+            except Exception:
+                pass  # Not JSON or unexpected shape, return the 400 error
+
+        elif status < 400 and QUOTA_ERROR_MARKER in body:
+            # Check for embedded token quota error in response body
+            try:
+                response_data = _json_loads(body)
+                choices = response_data.get('choices', [])
+                if choices:
+                    message_content = choices[0].get('message', {}).get('content', '')
+                    if 'token quota is not enough' in message_content:
+                        return "Detected embedded token quota error in response"
+            except Exception:
+                pass  # Not JSON or parsing failed, continue normally
+
+        return None
+
+    def _alternative_request_body(
         self,
         request_data: Dict[str, Any],
-        path: str,
-        method: str,
-        original_headers: Dict[str, str],
-        start_time: datetime,
-        original_request_body: bytes,
+        request_body: Optional[bytes],
+        model: str
+    ) -> bytes:
+        """
+        Serialize the request for an alternative API with its model swapped in.
+
+        Args:
+            request_data: The parsed client request.
+            request_body: Serialized request_data, if available.
+            model: The model the alternative API expects.
+
+        Returns:
+            request_body itself when the request already names the model (or names
+            none), otherwise request_data re-serialized with the model replaced.
+        """
+        if 'model' not in request_data or request_data['model'] == model:
+            return request_body if request_body is not None else _json_dumps(request_data)
+        # request_data came from _json_loads, which turns integers beyond 64 bits into floats;
+        # the body is re-parsed with the stdlib so such values are forwarded unchanged
+        if request_body is not None:
+            request_data = json.loads(request_body)
+        # Only the top-level model is replaced, so a shallow copy leaves request_data untouched
+        return _json_dumps({**request_data, 'model': model})
+
+    async def _route_to_alternative_api(
+        self,
+        route: AlternativeRoute,
         override_model: str = None
-    ) -> web.Response:
+    ) -> web.StreamResponse:
         """
         Route large requests to alternative APIs with fallback logic.
         First tries Synthetic API, then falls back to Z.ai API if that fails.
+        The chosen API's response is streamed back to the client as it arrives.
 
         Args:
+            route: The client request and everything needed to re-send it.
             override_model: Optional model to use instead of SYNTHETIC_MODEL (e.g., for vision requests)
         """
-        # Prepare modified request data with model change
+        method = route.request.method
         synthetic_model = override_model if override_model else SYNTHETIC_MODEL
-        synthetic_request_data = copy.deepcopy(request_data)
-        if 'model' in synthetic_request_data:
-            synthetic_request_data['model'] = synthetic_model
-
-        zai_request_data = copy.deepcopy(request_data)
-        if 'model' in zai_request_data:
-            zai_request_data['model'] = ZAI_MODEL
 
-        # Try Synthetic API first
+        # Try Synthetic API first. Only sending the request and receiving its status can
+        # fall back to Z.ai; once the response starts streaming to the client it is final.
         if self.synthetic_api_key:
-            logger.info(f"Routing request to Synthetic API with model: {synthetic_model}")
+            logger.info("Routing request to Synthetic API with model: %s", synthetic_model)
+            resp = None
             try:
-                synthetic_url = f"{SYNTHETIC_API_HOST}{path}"
-                synthetic_body = json.dumps(synthetic_request_data, separators=(',', ':')).encode('utf-8')
+                synthetic_url = f"{SYNTHETIC_API_HOST}{route.path}"
+                synthetic_body = self._alternative_request_body(route.request_data, route.request_body, synthetic_model)
 
-                headers = {key: value for key, value in original_headers.items()
-                          if key.lower() not in ('authorization', 'host', 'content-length')}
+                headers = self._upstream_headers(route.original_headers)
                 headers["Authorization"] = f"Bearer {self.synthetic_api_key}"
-                headers["User-Agent"] = "Cerebras-Proxy/1.0"
                 headers["Content-Length"] = str(len(synthetic_body))
 
-                async with aiohttp.ClientSession() as session:
-                    async with session.request(method, synthetic_url, headers=headers, data=synthetic_body) as resp:
-                        body = await resp.read()
-
-                        # If successful, return immediately
-                        if resp.status < 400:
-                            logger.info(f"Synthetic API request succeeded with status {resp.status}")
-                            response = web.Response(
-                                status=resp.status,
-                                body=body,
-                                headers={key: value for key, value in resp.headers.items()
-                                        if key.lower() not in ('content-length', 'transfer-encoding', 'content-encoding')}
-                            )
-
-                            # Log request/response
-                            end_time = datetime.utcnow()
-                            duration_ms = (end_time - start_time).total_seconds() * 1000
-                            await self._save_request_response_log(
-                                request_method=method,
-                                request_path=f"[SYNTHETIC] {path}",
-                                request_headers=original_headers,
-                                request_body=original_request_body,
-                                response_status=resp.status,
-                                response_headers=dict(resp.headers),
-                                response_body=body,
-                                duration_ms=duration_ms
-                            )
-                            return response
-                        else:
-                            logger.warning(f"Synthetic API returned error {resp.status}, falling back to Z.ai API")
+                resp = await self._session.request(method, synthetic_url, headers=headers, data=synthetic_body)
             except Exception as e:
-                logger.warning(f"Synthetic API failed with error: {e}, falling back to Z.ai API")
+                logger.warning("Synthetic API failed with error: %s, falling back to Z.ai API", e)
+
+            if resp is not None:
+                # If successful, stream it back immediately
+                if resp.status < 400:
+                    logger.info("Synthetic API request succeeded with status %s", resp.status)
+                    async with resp:
+                        return await self._stream_response(
+                            route.request, resp,
+                            log_path=f"[SYNTHETIC] {route.path}",
+                            request_headers=route.original_headers,
+                            original_request_body=route.original_request_body,
+                            start_time=route.start_time
+                        )
+                await self._discard_response(resp)
+                logger.warning("Synthetic API returned error %s, falling back to Z.ai API", resp.status)
         else:
             logger.warning("Synthetic API key not configured, skipping to Z.ai API")
 
         # Fallback to Z.ai API
         if self.zai_api_key:
-            logger.info(f"Routing request to Z.ai API (fallback)")
+            logger.info("Routing request to Z.ai API (fallback)")
             try:
-                zai_url = f"{ZAI_API_HOST}{path}"
-                zai_body = json.dumps(zai_request_data, separators=(',', ':')).encode('utf-8')
+                zai_url = f"{ZAI_API_HOST}{route.path}"
+                zai_body = self._alternative_request_body(route.request_data, route.request_body, ZAI_MODEL)
 
-                headers = {key: value for key, value in original_headers.items()
-                          if key.lower() not in ('authorization', 'host', 'content-length')}
+                headers = self._upstream_headers(route.original_headers)
                 headers["Authorization"] = f"Bearer {self.zai_api_key}"
-                headers["User-Agent"] = "Cerebras-Proxy/1.0"
                 headers["Content-Length"] = str(len(zai_body))
 
-                async with aiohttp.ClientSession() as session:
-                    async with session.request(method, zai_url, headers=headers, data=zai_body) as resp:
-                        body = await resp.read()
-
-                        logger.info(f"Z.ai API request completed with status {resp.status}")
-                        response = web.Response(
-                            status=resp.status,
-                            body=body,
-                            headers={key: value for key, value in resp.headers.items()
-                                    if key.lower() not in ('content-length', 'transfer-encoding', 'content-encoding')}
-                        )
-
-                        # Log request/response
-                        end_time = datetime.utcnow()
-                        duration_ms = (end_time - start_time).total_seconds() * 1000
-                        await self._save_request_response_log(
-                            request_method=method,
-                            request_path=f"[ZAI] {path}",
-                            request_headers=original_headers,
-                            request_body=original_request_body,
-                            response_status=resp.status,
-                            response_headers=dict(resp.headers),
-                            response_body=body,
-                            duration_ms=duration_ms
-                        )
-                        return response
+                resp = await self._session.request(method, zai_url, headers=headers, data=zai_body)
             except Exception as e:
-                logger.error(f"Z.ai API failed with error: {e}")
+                logger.error("Z.ai API failed with error: %s", e)
                 return web.Response(status=503, text=f"All alternative APIs failed: {e}")
+
+            logger.info("Z.ai API request completed with status %s", resp.status)
+            async with resp:
+                return await self._stream_response(
+                    route.request, resp,
+                    log_path=f"[ZAI] {route.path}",
+                    request_headers=route.original_headers,
+                    original_request_body=route.original_request_body,
+                    start_time=route.start_time
+                )
         else:
             logger.error("Z.ai API key not configured")
-            return web.Response(status=503, text="No alternative APIs configured")
+            return web.Response(status=503, body=ERROR_NO_ALTERNATIVE_APIS, content_type='text/plain', charset='utf-8')
 
-    async def _save_request_response_log(
+    def _queue_request_response_log(self, **log_kwargs):
+        """
+        Hand a request/response pair to the background log writer.
+        Never blocks the request path; entries are dropped if the queue is full.
+        """
+        if not LOG_REQUESTS_ENABLED or self._log_queue is None:
+            return
+
+        # Wall-clock nanoseconds; converted to a datetime only when the entry is built
+        log_kwargs["timestamp_ns"] = time.time_ns()
+        try:
+            self._log_queue.put_nowait(log_kwargs)
+        except asyncio.QueueFull:
+            self._dropped_log_entries += 1
+            # Warn on the first drop and then periodically, not once per request under load
+            if (self._dropped_log_entries - 1) % LOG_DROP_WARNING_INTERVAL == 0:
+                logger.warning("Request/response log queue is full, dropping log entries "
+                               "(%s dropped so far)", self._dropped_log_entries)
+
+    async def _log_writer(self):
+        """
+        Drain the log queue in batches, writing each batch from a worker thread
+        so that serialization and disk I/O never run on the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._log_queue.get()]
+            # Take whatever else is already waiting, up to the batch size
+            while len(batch) < LOG_BATCH_SIZE and not self._log_queue.empty():
+                batch.append(self._log_queue.get_nowait())
+            try:
+                await loop.run_in_executor(self._log_executor, self._write_log_batch, batch)
+            finally:
+                for _ in batch:
+                    self._log_queue.task_done()
+
+    async def _start_log_writer(self, app: web.Application):
+        self._log_queue = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+        # A dedicated single thread keeps log writes ordered and off the default
+        # executor that aiohttp uses for DNS resolution
+        self._log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-writer")
+        self._log_writer_task = asyncio.create_task(self._log_writer())
+
+    async def _stop_log_writer(self, app: web.Application):
+        if self._log_writer_task:
+            # Give pending entries a chance to be written before shutting down
+            try:
+                await asyncio.wait_for(self._log_queue.join(), timeout=5)
+            except asyncio.TimeoutError:
+                logger.warning("Dropping %s unwritten log entries on shutdown", self._log_queue.qsize())
+            self._log_writer_task.cancel()
+            try:
+                await self._log_writer_task
+            except asyncio.CancelledError:
+                pass
+            self._log_writer_task = None
+        if self._log_executor:
+            # Let a batch that is mid-write finish before its file descriptor is closed
+            self._log_executor.shutdown(wait=True)
+            self._log_executor = None
+        if self._dropped_log_entries:
+            logger.warning("%s request/response log entries were dropped "
+                           "because the log queue was full", self._dropped_log_entries)
+        if self._log_fd is not None:
+            os.close(self._log_fd)
+            self._log_fd = None
+
+    def _build_log_entry(
         self,
+        timestamp_ns: int,
         request_method: str,
         request_path: str,
-        request_headers: Dict[str, str],
+        request_headers: Mapping[str, str],
         request_body: bytes,
         response_status: int,
-        response_headers: Dict[str, str],
+        response_headers: Mapping[str, str],
         response_body: bytes,
-        duration_ms: float
-    ):
-        """
-        Save request and response data to a JSON file in the logs directory.
+        duration_ms: float,
+        response_body_truncated: bool = False,
+        response_interrupted: bool = False
+    ) -> Dict[str, Any]:
         """
-        if not LOG_REQUESTS_ENABLED:
-            return
+        Build the JSON-serializable log entry for a request/response pair.
 
+        Args:
+            response_body_truncated: Whether only the first LOG_MAX_BODY_BYTES
+                of a streamed response body were captured.
+            response_interrupted: Whether a streamed response was cut short
+                before its body was complete.
+        """
+        # Store bodies as opaque text; parsing JSON bodies only to re-serialize
+        # them into the log doubled the JSON work for every request
+        def decode_body(body: bytes, content_type: Optional[str]) -> Any:
+            if not body:
+                return None
+            # Declared binary payloads (images, octet-stream, multipart) skip the UTF-8 attempt
+            if content_type and not content_type.startswith(TEXT_CONTENT_TYPE_PREFIXES) \
+                    and 'json' not in content_type:
+                return {"_binary": base64.b64encode(body).decode('ascii')}
+            try:
+                return body.decode('utf-8')
+            except UnicodeDecodeError:
+                # Not valid UTF-8, store as base64 binary
+                return {"_binary": base64.b64encode(body).decode('ascii')}
+
+        request_content_type = request_headers.get('Content-Type') or request_headers.get('content-type')
+
+        seconds, nanoseconds = divmod(timestamp_ns, 1_000_000_000)
+        timestamp = datetime.utcfromtimestamp(seconds).replace(microsecond=nanoseconds // 1000)
+
+        entry = {
+            "timestamp": timestamp.isoformat(),
+            "request_id": os.urandom(4).hex(),
+            "request": {
+                "method": request_method,
+                "path": request_path,
+                "headers": self._sanitize_headers(request_headers),
+                "body": decode_body(request_body, request_content_type)
+            },
+            "response": {
+                "status": response_status,
+                "headers": dict(response_headers),
+                "body": decode_body(response_body, response_headers.get('Content-Type'))
+            },
+            "duration_ms": duration_ms
+        }
+        if response_body_truncated:
+            entry["response"]["_truncated"] = True
+        if response_interrupted:
+            entry["response"]["_interrupted"] = True
+        return entry
+
+    def _write_log_batch(self, batch: List[Dict[str, Any]]):
+        """
+        Append a batch of log entries to the per-date JSONL file
+        (LOG_DIR/YYYY-MM-DD.jsonl), one compact JSON object per line.
+        Runs in a worker thread via _log_writer.
+        """
         try:
-            # Create timestamp-based filename
-            timestamp = datetime.utcnow()
-            date_dir = timestamp.strftime("%Y-%m-%d")
-            timestamp_str = timestamp.strftime("%Y%m%d_%H%M%S_%f")
-            request_id = str(uuid.uuid4())[:8]
-
-            # Sanitize path for filename (replace / with _)
-            safe_path = request_path.replace('/', '_').replace('\\', '_')[:50]
-            filename = f"{timestamp_str}_{request_method}_{safe_path}_{request_id}.json"
-
-            # Create date subdirectory
-            log_dir = Path(LOG_DIR) / date_dir
-            log_dir.mkdir(parents=True, exist_ok=True)
-
-            # Decode body if possible
-            def decode_body(body: bytes) -> Any:
-                if not body:
-                    return None
+            lines: List[bytes] = []
+            for log_kwargs in batch:
                 try:
-                    # First, try to parse as JSON
-                    return json.loads(body.decode('utf-8'))
-                except json.JSONDecodeError:
-                    # Not JSON, try to decode as plain text (e.g., SSE streaming)
-                    try:
-                        return body.decode('utf-8')
-                    except UnicodeDecodeError:
-                        # Not valid UTF-8, store as base64 binary
-                        import base64
-                        return {"_binary": base64.b64encode(body).decode('ascii')}
-                except UnicodeDecodeError:
-                    # Not valid UTF-8, store as base64 binary
-                    import base64
-                    return {"_binary": base64.b64encode(body).decode('ascii')}
-
-            # Create log entry
-            log_entry = {
-                "timestamp": timestamp.isoformat(),
-                "request_id": request_id,
-                "request": {
-                    "method": request_method,
-                    "path": request_path,
-                    "headers": self._sanitize_headers(request_headers),
-                    "body": decode_body(request_body)
-                },
-                "response": {
-                    "status": response_status,
-                    "headers": dict(response_headers),
-                    "body": decode_body(response_body)
-                },
-                "duration_ms": duration_ms
-            }
-
-            # Write to file
-            log_file = log_dir / filename
-            with open(log_file, 'w') as f:
-                json.dump(log_entry, f, indent=2)
-
-            logger.debug(f"Saved request/response log to {log_file}")
+                    log_entry = self._build_log_entry(**log_kwargs)
+                except Exception as e:
+                    logger.error("Failed to build request/response log entry: %s", e)
+                    continue
+
+                # Rotate to a new file when the date rolls over
+                log_date = log_entry["timestamp"][:10]
+                if log_date != self._log_file_date:
+                    self._write_log_lines(lines)
+                    lines = []
+                    # Open the new file before closing the old one, so a failed open leaves the
+                    # current (still valid) descriptor in place instead of a closed fd number
+                    # that a later close could reuse on some unrelated file or socket.
+                    # O_APPEND makes every write land at the current end of the file.
+                    new_fd = os.open(os.path.join(LOG_DIR, f"{log_date}.jsonl"),
+                                     os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                    if self._log_fd is not None:
+                        os.close(self._log_fd)
+                    self._log_fd = new_fd
+                    self._log_file_date = log_date
+
+                lines.append(_json_dumps(log_entry))
+
+            self._write_log_lines(lines)
+            logger.debug("Saved %s request/response log entries", len(batch))
 
         except Exception as e:
-            logger.error(f"Failed to save request/response log: {e}")
+            logger.error("Failed to save request/response log: %s", e)
+
+    def _write_log_lines(self, lines: List[bytes]):
+        """Write serialized log lines to the current log file, unbuffered."""
+        if lines:
+            data = memoryview(b"\n".join(lines) + b"\n")
+            while data:
+                written = os.write(self._log_fd, data)
+                data = data[written:]
+
+    def _client_response_headers(self, resp: aiohttp.ClientResponse) -> CIMultiDict:
+        """
+        Copy the upstream response headers for the client response, without
+        the framing headers aiohttp recomputes. Repeated headers such as
+        Set-Cookie are kept.
+        """
+        headers = resp.headers.copy()
+        for name in STRIPPED_RESPONSE_HEADERS:
+            headers.popall(name, None)
+        return headers
+
+    async def _discard_response(self, resp: aiohttp.ClientResponse):
+        """
+        Discard an upstream response body that will not be forwarded. Small bodies are
+        read to the end so the connection is reused; releasing an unread body makes
+        aiohttp close the connection, and the next attempt pays a new TCP/TLS handshake.
+        """
+        if resp.content_length is not None and resp.content_length <= DRAIN_RESPONSE_BODY_LIMIT:
+            try:
+                await resp.read()
+                return
+            except Exception as e:
+                logger.debug("Failed to drain discarded response: %s", e)
+        resp.release()
+
+    def _finalize_response(
+        self,
+        resp: aiohttp.ClientResponse,
+        body: bytes,
+        method: str,
+        log_path: str,
+        request_headers: Mapping[str, str],
+        original_request_body: bytes,
+        start_time: float
+    ) -> web.Response:
+        """
+        Build the client response for a fully read upstream response and
+        queue the request/response log entry.
+
+        Args:
+            resp: The upstream response; its body must already be read.
+            body: The upstream response body.
+            log_path: Path recorded in the log, prefixed for alternative APIs.
+        """
+        response = web.Response(
+            status=resp.status,
+            body=body,
+            headers=self._client_response_headers(resp)
+        )
+
+        if LOG_REQUESTS_ENABLED:
+            self._queue_request_response_log(
+                request_method=method,
+                request_path=log_path,
+                request_headers=request_headers,
+                request_body=original_request_body,
+                response_status=resp.status,
+                response_headers=resp.headers,
+                response_body=body,
+                duration_ms=(time.perf_counter() - start_time) * 1000.0
+            )
+        return response
+
+    async def _stream_response(
+        self,
+        request: web.Request,
+        resp: aiohttp.ClientResponse,
+        log_path: str,
+        request_headers: Mapping[str, str],
+        original_request_body: bytes,
+        start_time: float
+    ) -> web.StreamResponse:
+        """
+        Forward an upstream response to the client as it arrives instead of
+        buffering the whole body first. The body is captured for the
+        request/response log only when logging is enabled.
+        """
+        response = web.StreamResponse(
+            status=resp.status,
+            headers=self._client_response_headers(resp)
+        )
+
+        captured = bytearray() if LOG_REQUESTS_ENABLED else None
+        truncated = False
+        interrupted = False
+        try:
+            # Sending the headers fails if the client already disconnected; that is not an
+            # upstream error, so it must not reach the caller's key-rotating retry loop
+            await response.prepare(request)
+            # Bounded chunks keep per-write allocations small; read() still returns as soon
+            # as any data arrives, so server-sent events are not delayed
+            async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+                await response.write(chunk)
+                if captured is not None and not truncated:
+                    room = LOG_MAX_BODY_BYTES - len(captured)
+                    if len(chunk) > room:
+                        captured.extend(chunk[:room])
+                        truncated = True
+                    else:
+                        captured.extend(chunk)
+            await response.write_eof()
+        except Exception as e:
+            # Headers may already be sent, so the response can only be cut short here. Any
+            # error (client disconnects, upstream failures and timeouts) must end here: letting
+            # it reach a caller that retries or builds a second response would corrupt the
+            # client connection. Aborting the transport instead of finishing the chunked body
+            # lets the client see that the response is incomplete.
+            logger.warning("Streaming response interrupted: %r", e)
+            interrupted = True
+            if request.transport is not None:
+                request.transport.abort()
+
+        if captured is not None:
+            self._queue_request_response_log(
+                request_method=request.method,
+                request_path=log_path,
+                request_headers=request_headers,
+                request_body=original_request_body,
+                response_status=resp.status,
+                response_headers=resp.headers,
+                response_body=bytes(captured),
+                duration_ms=(time.perf_counter() - start_time) * 1000.0,
+                response_body_truncated=truncated,
+                response_interrupted=interrupted
+            )
+        return response
 
     async def status_handler(self, request: web.Request) -> web.Response:
         """
@@ -383,36 +846,25 @@ class ProxyServer:
         Handles all incoming requests, forwards them to the target API,
         and returns the response. Implements smart retry logic with key rotation.
         """
-        start_time = datetime.utcnow()
+        start_time = time.perf_counter()
 
         # Verify incoming API key if key management is enabled
         if self.incoming_key_manager:
             auth_header = request.headers.get('Authorization', '')
             if not auth_header:
                 logger.warning("Request rejected: Missing Authorization header")
-                return web.Response(
-                    status=401,
-                    text='{"error": {"message": "Missing Authorization header", "type": "invalid_request_error", "code": "missing_authorization"}}'
-                )
+                return web.Response(status=401, body=AUTH_ERROR_MISSING_HEADER, content_type='application/json')
 
-            # Extract the API key from "Bearer <key>" format
-            parts = auth_header.split()
-            if len(parts) != 2 or parts[0].lower() != 'bearer':
+            # Extract the API key from "Bearer <key>" format (scheme is case-insensitive)
+            incoming_api_key = auth_header[7:].strip() if auth_header[:7].lower() == 'bearer ' else ''
+            if not incoming_api_key:
                 logger.warning("Request rejected: Invalid Authorization header format")
-                return web.Response(
-                    status=401,
-                    text='{"error": {"message": "Invalid Authorization header format", "type": "invalid_request_error", "code": "invalid_authorization"}}'
-                )
-
-            incoming_api_key = parts[1]
+                return web.Response(status=401, body=AUTH_ERROR_INVALID_FORMAT, content_type='application/json')
 
             # Verify the API key
             if not self.incoming_key_manager.verify_api_key(incoming_api_key):
-                logger.warning(f"Request rejected: Invalid or revoked API key: {incoming_api_key[:10]}...")
-                return web.Response(
-                    status=401,
-                    text='{"error": {"message": "Invalid API key", "type": "invalid_request_error", "code": "invalid_api_key"}}'
-                )
+                logger.warning("Request rejected: Invalid or revoked API key: %s...", incoming_api_key[:10])
+                return web.Response(status=401, body=AUTH_ERROR_INVALID_KEY, content_type='application/json')
 
         path = request.match_info["path"]
 
@@ -422,9 +874,20 @@ class ProxyServer:
 
         target_url = f"{TARGET_API_HOST}{path}"
 
+        # Chat completion requests are the only ones inspected for routing and tool call fixes
+        is_chat_completion = path == 'chat/completions' or path.endswith('/chat/completions')
+
+        # Only parse bodies that are (or may be) JSON; clients that omit Content-Type are still parsed
+        content_type = request.headers.get('Content-Type')
+        is_json_body = is_chat_completion and (content_type is None or 'json' in content_type.lower())
+
+        # Client headers shared by alternative API routing and the request log. The
+        # read-only proxy is passed as is; the log writer copies it off the request path.
+        request_headers = request.headers
+
         # Check Content-Length header for early routing decision (before reading body)
         content_length = request.headers.get('Content-Length')
-        if content_length and 'chat/completions' in path:
+        if content_length and is_json_body:
             try:
                 content_length_int = int(content_length)
                 estimated_tokens = int(content_length_int / BYTES_PER_TOKEN)
@@ -435,47 +898,51 @@ class ProxyServer:
                     # Read body and parse for routing
                     request_body = await request.read()
                     try:
-                        request_data = json.loads(request_body.decode('utf-8'))
-                        logger.info(f"Routing large request to alternative APIs")
-                        return await self._route_to_alternative_api(
+                        request_data = _json_loads(request_body)
+                        logger.info("Routing large request to alternative APIs")
+                        return await self._route_to_alternative_api(AlternativeRoute(
+                            request=request,
                             request_data=request_data,
                             path=path,
-                            method=request.method,
-                            original_headers=dict(request.headers),
+                            original_headers=request_headers,
                             start_time=start_time,
-                            original_request_body=request_body
-                        )
+                            original_request_body=request_body,
+                            request_body=request_body
+                        ))
                     except json.JSONDecodeError:
                         logger.warning("Large request is not valid JSON, continuing with Cerebras")
             except (ValueError, TypeError):
                 pass  # Invalid Content-Length, continue normally
 
+        # Large or chunked bodies of non-chat requests are forwarded upstream as they
+        # arrive instead of being buffered. Chat completions are always buffered since
+        # the body is inspected for tool call fixes and routing.
+        stream_request_body = (
+            not is_chat_completion
+            and request.body_exists
+            and (request.content_length is None or request.content_length >= STREAM_REQUEST_BODY_THRESHOLD)
+        )
+
         # Read request body once for both forwarding and logging
-        request_body = await request.read()
+        request_body = None if stream_request_body else await request.read()
         original_request_body = request_body
 
         # Apply tool_call validation fix for chat completion requests (ALWAYS ENABLED)
         request_data_for_routing = None
-        if 'chat/completions' in path and request_body:
+        if is_json_body and request_body:
             try:
-                request_data = json.loads(request_body.decode('utf-8'))
-                original_msg_count = len(request_data.get('messages', []))
-
-                fixed_request_data = self._fix_missing_tool_responses(request_data)
-                fixed_msg_count = len(fixed_request_data.get('messages', []))
-
-                # Only use the fixed body if we actually made changes
-                if fixed_msg_count > original_msg_count:
-                    # Serialize with compact separators to match original formatting
-                    fixed_body = json.dumps(fixed_request_data, separators=(',', ':')).encode('utf-8')
-
-                    # Validate the serialized JSON
-                    test_parse = json.loads(fixed_body.decode('utf-8'))
-                    if not isinstance(test_parse, dict):
-                        raise ValueError("Serialized data is not a valid JSON object")
-
+                request_data = _json_loads(request_body)
+                fixed_request_data = self._fix_missing_tool_responses(request_data, log=False)
+
+                # Only re-serialize the body if the fix actually changed something
+                if fixed_request_data is not request_data:
+                    # Re-parse with the stdlib before re-serializing: _json_loads turns integers
+                    # beyond 64 bits into floats, which would change them in the forwarded body
+                    fixed_request_data = self._fix_missing_tool_responses(json.loads(request_body))
+                    # Serialize compactly to match original formatting
+                    fixed_body = _json_dumps(fixed_request_data)
                     request_body = fixed_body
-                    logger.info(f"Applied tool_call fix: {original_msg_count} -> {fixed_msg_count} messages (size: {len(original_request_body)} -> {len(fixed_body)} bytes)")
+                    logger.info("Applied tool_call fix: %s -> %s messages (size: %s -> %s bytes)", len(request_data['messages']), len(fixed_request_data['messages']), len(original_request_body), len(fixed_body))
                     request_data_for_routing = fixed_request_data
                 else:
                     request_data_for_routing = request_data
@@ -483,346 +950,192 @@ class ProxyServer:
                 # Not JSON, continue with normal routing
                 pass
             except Exception as e:
-                logger.error(f"Tool call fix failed: {e}", exc_info=True)
+                logger.error("Tool call fix failed: %s", e, exc_info=True)
                 request_body = original_request_body
 
+        # Parsed chat completions can be re-sent to the alternative APIs
+        route = None
+        if request_data_for_routing:
+            route = AlternativeRoute(
+                request=request,
+                request_data=request_data_for_routing,
+                path=path,
+                original_headers=request_headers,
+                start_time=start_time,
+                original_request_body=original_request_body,
+                request_body=request_body
+            )
+
+        # Whether errors and exhausted keys can be handed to the alternative APIs
+        can_fail_over = route is not None and bool(self.synthetic_api_key or self.zai_api_key)
+
         # Get headers AFTER body modification, excluding Authorization, Host, and Content-Length
         # Content-Length must be recalculated to match the (possibly modified) body
-        headers = {key: value for key, value in request.headers.items()
-                   if key.lower() not in ('authorization', 'host', 'content-length')}
-        headers["User-Agent"] = "Cerebras-Proxy/1.0"
+        headers = self._upstream_headers(request_headers)
 
         # Set correct Content-Length for the (possibly modified) body
         if request_body:
             headers["Content-Length"] = str(len(request_body))
+        elif stream_request_body and request.content_length is not None:
+            headers["Content-Length"] = str(request.content_length)
 
-        logger.info(f"Processing request to {target_url}")
+        logger.info("Processing request to %s", target_url)
 
         # Check if request contains images and route to vision model
-        if request_data_for_routing and self._has_image_content(request_data_for_routing):
+        if route and self._has_image_content(route.request_data):
             if self.synthetic_api_key:
                 logger.info("Image content detected, routing to Synthetic API with vision model")
-                return await self._route_to_alternative_api(
-                    request_data=request_data_for_routing,
-                    path=path,
-                    method=request.method,
-                    original_headers=dict(request.headers),
-                    start_time=start_time,
-                    original_request_body=original_request_body,
-                    override_model=SYNTHETIC_VISION_MODEL
-                )
+                return await self._route_to_alternative_api(route, override_model=SYNTHETIC_VISION_MODEL)
             else:
                 logger.warning("Image content detected but Synthetic API key not configured")
 
-        # Check if all Cerebras keys are rate-limited and fallback is enabled
-        if self.fallback_on_cooldown and await self.api_key_manager.all_keys_rate_limited():
-            if self.synthetic_api_key or self.zai_api_key:
-                logger.warning("All Cerebras keys are rate-limited. Falling back to alternative APIs.")
-                # Parse request data for routing if not already done
-                if request_data_for_routing is None and 'chat/completions' in path and request_body:
-                    try:
-                        request_data_for_routing = json.loads(request_body.decode('utf-8'))
-                    except:
-                        pass
-
-                if request_data_for_routing:
-                    return await self._route_to_alternative_api(
-                        request_data=request_data_for_routing,
-                        path=path,
-                        method=request.method,
-                        original_headers=dict(request.headers),
-                        start_time=start_time,
-                        original_request_body=original_request_body
-                    )
-            else:
-                logger.warning("All Cerebras keys rate-limited but no alternative APIs configured")
-
         # Retry with automatic key rotation
         max_retries = self.api_key_manager.get_key_count() * 2  # Allow multiple passes through all keys
+        if stream_request_body:
+            # A streamed body is consumed by the first attempt and cannot be replayed
+            max_retries = 1
+
+        # Only methods that carry a body forward the (possibly fixed) request body
+        method = request.method
+        if stream_request_body:
+            data = request.content
+        else:
+            data = request_body if method not in ("GET", "HEAD", "OPTIONS") else None
 
         for attempt in range(max_retries):
+            # Check if all Cerebras keys are rate-limited and fallback is enabled. Checked before
+            # every attempt, since concurrent requests may exhaust the keys between retries,
+            # so the request fails over instead of waiting out the cooldown in get_current_key.
+            if self.fallback_on_cooldown and await self.api_key_manager.all_keys_rate_limited():
+                # The body was already parsed above; requests that are not JSON chat
+                # completions have no routing data and wait for a Cerebras key instead
+                if can_fail_over:
+                    logger.warning("All Cerebras keys are rate-limited. Falling back to alternative APIs.")
+                    return await self._route_to_alternative_api(route)
+                if attempt == 0 and not (self.synthetic_api_key or self.zai_api_key):
+                    logger.warning("All Cerebras keys rate-limited but no alternative APIs configured")
+
+            # Fail fast rather than parking the request while every key cools down
+            if self.max_key_wait is not None:
+                wait_time = self.api_key_manager.seconds_until_available()
+                if wait_time > self.max_key_wait:
+                    logger.warning("All keys rate-limited for another %.1fs, "
+                                   "exceeding max wait of %.1fs. Rejecting request.", wait_time, self.max_key_wait)
+                    return web.Response(
+                        status=503,
+                        headers={'Retry-After': str(math.ceil(wait_time))},
+                        body=ERROR_KEYS_RATE_LIMITED,
+                        content_type='text/plain',
+                        charset='utf-8'
+                    )
+
             # Get the current API key (will wait if all are rate-limited)
             api_key = await self.api_key_manager.get_current_key()
-            headers["Authorization"] = f"Bearer {api_key}"
+            headers["Authorization"] = self.api_key_manager.bearer_for(api_key)
 
             try:
-                # Use aiohttp client to make request
-                async with aiohttp.ClientSession() as session:
-                    # Prepare the request based on the method
-                    method = request.method
-                    if method in ("GET", "HEAD", "OPTIONS"):
-                        async with session.request(method, target_url, headers=headers) as resp:
-                            # Stream the response body back to the client
-                            body = await resp.read()
-                            # Create a new response with the target API's status and headers
-                            response = web.Response(
-                                status=resp.status,
-                                body=body,
-                                headers={key: value for key, value in resp.headers.items()
-                                         if key.lower() not in ('content-length', 'transfer-encoding', 'content-encoding')}
-                            )
-
-                            # Handle rate limiting
-                            if resp.status == 429:
-                                logger.warning(f"Rate limited (429), marking key and switching...")
-                                await self.api_key_manager.mark_key_rate_limited(api_key)
-
-                                # Check if all keys are now rate-limited and fallback is enabled
-                                if self.fallback_on_cooldown and await self.api_key_manager.all_keys_rate_limited():
-                                    if (self.synthetic_api_key or self.zai_api_key) and request_data_for_routing:
-                                        logger.warning("All Cerebras keys now rate-limited after 429. Falling back to alternative APIs.")
-                                        return await self._route_to_alternative_api(
-                                            request_data=request_data_for_routing,
-                                            path=path,
-                                            method=method,
-                                            original_headers=dict(request.headers),
-                                            start_time=start_time,
-                                            original_request_body=original_request_body
-                                        )
-                                continue
-                            elif resp.status == 500:
-                                logger.warning(f"Server error (500), trying next key...")
-                                await self.api_key_manager.mark_key_rate_limited(api_key)
-
-                                # Check if all keys are now rate-limited and fallback is enabled
-                                if self.fallback_on_cooldown and await self.api_key_manager.all_keys_rate_limited():
-                                    if (self.synthetic_api_key or self.zai_api_key) and request_data_for_routing:
-                                        logger.warning("All Cerebras keys now rate-limited after 500. Falling back to alternative APIs.")
-                                        return await self._route_to_alternative_api(
-                                            request_data=request_data_for_routing,
-                                            path=path,
-                                            method=method,
-                                            original_headers=dict(request.headers),
-                                            start_time=start_time,
-                                            original_request_body=original_request_body
-                                        )
-                                continue
-                            elif resp.status == 400:
-                                # Check if this is a context_length_exceeded error
-                                try:
-                                    error_data = json.loads(body.decode('utf-8'))
-                                    error_code = error_data.get('error', {}).get('code') or error_data.get('code')
-                                    if error_code == 'context_length_exceeded':
-                                        logger.warning(f"Context length exceeded (400), routing to alternative APIs")
-                                        if (self.synthetic_api_key or self.zai_api_key) and request_data_for_routing:
-                                            return await self._route_to_alternative_api(
-                                                request_data=request_data_for_routing,
-                                                path=path,
-                                                method=method,
-                                                original_headers=dict(request.headers),
-                                                start_time=start_time,
-                                                original_request_body=original_request_body
-                                            )
-                                except:
-                                    pass
-                                # If not context_length_exceeded or can't route, fall through to return the 400 error
-                                logger.info(f"Request completed with status {resp.status}")
-                            elif resp.status == 503:
-                                # Service unavailable, route to alternative APIs if available
-                                logger.warning(f"Service unavailable (503), routing to alternative APIs")
-                                if (self.synthetic_api_key or self.zai_api_key) and request_data_for_routing:
-                                    return await self._route_to_alternative_api(
-                                        request_data=request_data_for_routing,
-                                        path=path,
-                                        method=method,
-                                        original_headers=dict(request.headers),
-                                        start_time=start_time,
-                                        original_request_body=original_request_body
-                                    )
-                                # If can't route to alternative APIs, fall through to return the 503 error
-                                logger.info(f"Request completed with status {resp.status}")
-                            else:
-                                # Success or non-retryable error
-                                if resp.status < 400:
-                                    # Check for embedded token quota error in response body
-                                    try:
-                                        response_data = json.loads(body.decode('utf-8'))
-                                        choices = response_data.get('choices', [])
-                                        if choices and len(choices) > 0:
-                                            message_content = choices[0].get('message', {}).get('content', '')
-                                            if 'token quota is not enough' in message_content:
-                                                logger.warning("Detected embedded token quota error in response, routing to alternative APIs")
-                                                if (self.synthetic_api_key or self.zai_api_key) and request_data_for_routing:
-                                                    return await self._route_to_alternative_api(
-                                                        request_data=request_data_for_routing,
-                                                        path=path,
-                                                        method=method,
-                                                        original_headers=dict(request.headers),
-                                                        start_time=start_time,
-                                                        original_request_body=original_request_body
-                                                    )
-                                    except:
-                                        pass  # Not JSON or parsing failed, continue normally
-
-                                    await self.api_key_manager.mark_key_success(api_key)
-                                logger.info(f"Request completed with status {resp.status}")
-
-                                # Log request/response if enabled
-                                end_time = datetime.utcnow()
-                                duration_ms = (end_time - start_time).total_seconds() * 1000
-                                await self._save_request_response_log(
-                                    request_method=method,
-                                    request_path=path,
-                                    request_headers=dict(request.headers),
-                                    request_body=original_request_body,
-                                    response_status=resp.status,
-                                    response_headers=dict(resp.headers),
-                                    response_body=body,
-                                    duration_ms=duration_ms
-                                )
-
-                                return response
-                    else:
-                        # For methods with bodies (POST, PUT, PATCH, DELETE)
-                        # Use the fixed request body for forwarding
-                        async with session.request(method, target_url, headers=headers,
-                                                   data=request_body) as resp:
-                            # Stream the response body back to the client
-                            body = await resp.read()
-                            response = web.Response(
-                                status=resp.status,
-                                body=body,
-                                headers={key: value for key, value in resp.headers.items()
-                                         if key.lower() not in ('content-length', 'transfer-encoding', 'content-encoding')}
-                            )
-
-                            # Handle rate limiting
-                            if resp.status == 429:
-                                logger.warning(f"Rate limited (429), marking key and switching...")
-                                await self.api_key_manager.mark_key_rate_limited(api_key)
-
-                                # Check if all keys are now rate-limited and fallback is enabled
-                                if self.fallback_on_cooldown and await self.api_key_manager.all_keys_rate_limited():
-                                    if (self.synthetic_api_key or self.zai_api_key) and request_data_for_routing:
-                                        logger.warning("All Cerebras keys now rate-limited after 429. Falling back to alternative APIs.")
-                                        return await self._route_to_alternative_api(
-                                            request_data=request_data_for_routing,
-                                            path=path,
-                                            method=method,
-                                            original_headers=dict(request.headers),
-                                            start_time=start_time,
-                                            original_request_body=original_request_body
-                                        )
-                                continue
-                            elif resp.status == 500:
-                                logger.warning(f"Server error (500), trying next key...")
-                                await self.api_key_manager.mark_key_rate_limited(api_key)
-
-                                # Check if all keys are now rate-limited and fallback is enabled
-                                if self.fallback_on_cooldown and await self.api_key_manager.all_keys_rate_limited():
-                                    if (self.synthetic_api_key or self.zai_api_key) and request_data_for_routing:
-                                        logger.warning("All Cerebras keys now rate-limited after 500. Falling back to alternative APIs.")
-                                        return await self._route_to_alternative_api(
-                                            request_data=request_data_for_routing,
-                                            path=path,
-                                            method=method,
-                                            original_headers=dict(request.headers),
-                                            start_time=start_time,
-                                            original_request_body=original_request_body
-                                        )
-                                continue
-                            elif resp.status == 400:
-                                # Check if this is a context_length_exceeded error
-                                try:
-                                    error_data = json.loads(body.decode('utf-8'))
-                                    error_code = error_data.get('error', {}).get('code') or error_data.get('code')
-                                    if error_code == 'context_length_exceeded':
-                                        logger.warning(f"Context length exceeded (400), routing to alternative APIs")
-                                        if (self.synthetic_api_key or self.zai_api_key) and request_data_for_routing:
-                                            return await self._route_to_alternative_api(
-                                                request_data=request_data_for_routing,
-                                                path=path,
-                                                method=method,
-                                                original_headers=dict(request.headers),
-                                                start_time=start_time,
-                                                original_request_body=original_request_body
-                                            )
-                                except:
-                                    pass
-                                # If not context_length_exceeded or can't route, fall through to return the 400 error
-                                logger.info(f"Request completed with status {resp.status}")
-                            elif resp.status == 503:
-                                # Service unavailable, route to alternative APIs if available
-                                logger.warning(f"Service unavailable (503), routing to alternative APIs")
-                                if (self.synthetic_api_key or self.zai_api_key) and request_data_for_routing:
-                                    return await self._route_to_alternative_api(
-                                        request_data=request_data_for_routing,
-                                        path=path,
-                                        method=method,
-                                        original_headers=dict(request.headers),
-                                        start_time=start_time,
-                                        original_request_body=original_request_body
-                                    )
-                                # If can't route to alternative APIs, fall through to return the 503 error
-                                logger.info(f"Request completed with status {resp.status}")
-                            else:
-                                # Success or non-retryable error
-                                if resp.status < 400:
-                                    # Check for embedded token quota error in response body
-                                    try:
-                                        response_data = json.loads(body.decode('utf-8'))
-                                        choices = response_data.get('choices', [])
-                                        if choices and len(choices) > 0:
-                                            message_content = choices[0].get('message', {}).get('content', '')
-                                            if 'token quota is not enough' in message_content:
-                                                logger.warning("Detected embedded token quota error in response, routing to alternative APIs")
-                                                if (self.synthetic_api_key or self.zai_api_key) and request_data_for_routing:
-                                                    return await self._route_to_alternative_api(
-                                                        request_data=request_data_for_routing,
-                                                        path=path,
-                                                        method=method,
-                                                        original_headers=dict(request.headers),
-                                                        start_time=start_time,
-                                                        original_request_body=original_request_body
-                                                    )
-                                    except:
-                                        pass  # Not JSON or parsing failed, continue normally
-
-                                    await self.api_key_manager.mark_key_success(api_key)
-                                logger.info(f"Request completed with status {resp.status}")
-
-                                # Log request/response if enabled
-                                end_time = datetime.utcnow()
-                                duration_ms = (end_time - start_time).total_seconds() * 1000
-                                await self._save_request_response_log(
-                                    request_method=method,
-                                    request_path=path,
-                                    request_headers=dict(request.headers),
-                                    request_body=original_request_body,
-                                    response_status=resp.status,
-                                    response_headers=dict(resp.headers),
-                                    response_body=body,
-                                    duration_ms=duration_ms
-                                )
-
-                                return response
+                async with self._session.request(method, target_url, headers=headers, data=data) as resp:
+                    # Successful non-JSON responses (e.g. SSE streams) and large JSON responses
+                    # are forwarded chunk by chunk as they arrive. Other JSON responses are
+                    # buffered below since the body is inspected for embedded errors first.
+                    if resp.status < 400 and (
+                        resp.content_type != 'application/json'
+                        or (resp.content_length is not None and resp.content_length > INSPECT_RESPONSE_BODY_LIMIT)
+                    ):
+                        await self.api_key_manager.mark_key_success(api_key)
+                        logger.info("Streaming response with status %s", resp.status)
+                        return await self._stream_response(
+                            request, resp,
+                            log_path=path,
+                            request_headers=request_headers,
+                            original_request_body=original_request_body,
+                            start_time=start_time
+                        )
+
+                    # Rate limits and server errors rotate to the next key; their body is discarded
+                    if resp.status in ROTATE_KEY_ERROR_CODES:
+                        await self._discard_response(resp)
+                        logger.warning("Upstream returned %s, marking key and switching...", resp.status)
+                        await self.api_key_manager.mark_key_rate_limited(api_key)
+
+                        # Check if all keys are now rate-limited and fallback is enabled
+                        if self.fallback_on_cooldown and await self.api_key_manager.all_keys_rate_limited():
+                            if can_fail_over:
+                                logger.warning("All Cerebras keys now rate-limited after %s. Falling back to alternative APIs.", resp.status)
+                                return await self._route_to_alternative_api(route)
+                        continue
+
+                    # Only terminal responses (success or non-retryable error) are read
+                    body = await resp.read()
+
+                    # Errors an alternative API can serve fail over; everything else is returned.
+                    # The body is only probed when the request could actually be re-routed.
+                    if can_fail_over:
+                        fallback_reason = self._fallback_reason(resp.status, body)
+                        if fallback_reason:
+                            logger.warning("%s, routing to alternative APIs", fallback_reason)
+                            return await self._route_to_alternative_api(route)
+
+                    if resp.status < 400:
+                        await self.api_key_manager.mark_key_success(api_key)
+                    logger.info("Request completed with status %s", resp.status)
+                    return self._finalize_response(
+                        resp, body,
+                        method=method,
+                        log_path=path,
+                        request_headers=request_headers,
+                        original_request_body=original_request_body,
+                        start_time=start_time
+                    )
 
             except aiohttp.ClientError as e:
-                logger.error(f"Client error on attempt {attempt + 1}: {e}")
+                logger.error("Client error on attempt %s: %s", attempt + 1, e)
                 # For client errors, try the next key
                 await self.api_key_manager.mark_key_rate_limited(api_key)
                 continue
             except Exception as e:
-                logger.error(f"Unexpected error on attempt {attempt + 1}: {e}")
+                logger.error("Unexpected error on attempt %s: %s", attempt + 1, e)
                 # Return a 500 error to the client for unexpected issues
                 return web.Response(status=500, text=f"Proxy error: {e}")
 
         # If we get here, all attempts failed
         logger.error("Maximum retry attempts exceeded.")
-        return web.Response(status=503, text="Service unavailable: Maximum retries exceeded.")
+        return web.Response(status=503, body=ERROR_MAX_RETRIES, content_type='text/plain', charset='utf-8')
         
     async def run(self, host: str = "0.0.0.0", port: int = 8080):
         """
-        Starts the proxy server using the existing event loop.
+        Starts the proxy server using the existing event loop and serves
+        until stop() is called or the process receives SIGINT/SIGTERM.
         """
-        runner = web.AppRunner(self.app)
+        self._shutdown_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError:
+                # Signal handlers are unavailable on Windows event loops
+                pass
+
+        # aiohttp's access log formats a line per request; the handler already logs each outcome
+        runner = web.AppRunner(self.app, access_log=None)
         await runner.setup()
         site = web.TCPSite(runner, host, port)
         await site.start()
-        
-        # Keep the server running
-        while True:
-            await asyncio.sleep(3600)  # Sleep for an hour, effectively running forever
+
+        # Block without periodic wakeups until shutdown is requested
+        try:
+            await self._shutdown_event.wait()
+        finally:
+            logger.info("Shutting down proxy server...")
+            # Runs the on_cleanup hooks: flushes logs and usage, closes the upstream session
+            await runner.cleanup()
+
+    def stop(self):
+        """
+        Requests a graceful shutdown of a server started with run().
+        """
+        if self._shutdown_event is not None:
+            self._shutdown_event.set()
 
 
 # Example startup logic to load API keys from environment variable
@@ -836,19 +1149,19 @@ async def main():
 
     # Get the API keys from the environment variable
     api_keys_json = os.environ.get("CEREBRAS_API_KEYS", "{}")
-    logger.info(f"Retrieved API keys JSON: {repr(api_keys_json)}")
+    logger.info("Retrieved API keys JSON: %r", api_keys_json)
 
     try:
-        api_keys: Dict[str, str] = json.loads(api_keys_json)
-        logger.info(f"Successfully parsed {len(api_keys)} API keys")
+        api_keys: Dict[str, str] = _json_loads(api_keys_json)
+        logger.info("Successfully parsed %s API keys", len(api_keys))
     except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON for API keys: {e}")
-        logger.error(f"Raw API keys value: {repr(api_keys_json)}")
+        logger.error("Invalid JSON for API keys: %s", e)
+        logger.error("Raw API keys value: %r", api_keys_json)
         return
 
     # Get optional cooldown configuration
     cooldown_seconds = int(os.environ.get("CEREBRAS_COOLDOWN", "60"))
-    logger.info(f"Cooldown period set to {cooldown_seconds} seconds")
+    logger.info("Cooldown period set to %s seconds", cooldown_seconds)
 
     # Create the API key manager
     api_key_manager = ApiKeyManager(api_keys, cooldown_seconds=cooldown_seconds)
@@ -868,8 +1181,11 @@ async def main():
     enable_incoming_auth = os.environ.get("ENABLE_INCOMING_AUTH", "false").lower() == "true"
     if enable_incoming_auth:
         incoming_key_db = os.environ.get("INCOMING_KEY_DB", "./data/incoming_keys.db")
-        incoming_key_manager = IncomingKeyManager(incoming_key_db)
-        logger.info(f"Incoming API key authentication enabled. Database: {incoming_key_db}")
+        # Seconds before revocations made by manage_keys.py take effect (0 re-reads the keys on every request)
+        incoming_key_cache_ttl = float(os.environ.get("INCOMING_KEY_CACHE_TTL", "30"))
+        incoming_key_manager = IncomingKeyManager(incoming_key_db, cache_ttl=incoming_key_cache_ttl)
+        logger.info("Incoming API key authentication enabled. Database: %s", incoming_key_db)
+        logger.info("Incoming API key changes are picked up within %ss", incoming_key_cache_ttl)
     else:
         logger.info("Incoming API key authentication disabled (set ENABLE_INCOMING_AUTH=true to enable)")
 
@@ -881,26 +1197,33 @@ async def main():
         else:
             logger.warning("Fallback on cooldown enabled but no alternative APIs configured")
 
+    # Get optional limit on how long requests wait for a rate-limited key
+    max_key_wait_env = os.environ.get("CEREBRAS_MAX_KEY_WAIT")
+    max_key_wait = float(max_key_wait_env) if max_key_wait_env else None
+    if max_key_wait is not None:
+        logger.info("Requests fail fast with 503 when no key is available within %ss", max_key_wait)
+
     # Create and run the proxy server
     proxy = ProxyServer(
         api_key_manager,
         incoming_key_manager=incoming_key_manager,
         synthetic_api_key=synthetic_api_key,
         zai_api_key=zai_api_key,
-        fallback_on_cooldown=fallback_on_cooldown
+        fallback_on_cooldown=fallback_on_cooldown,
+        max_key_wait=max_key_wait
     )
     logger.info("About to call proxy.run() with proper event loop integration")
     await proxy.run()
 
 
 if __name__ == "__main__":
+    # Prefer the libuv-based event loop when it is installed (not available on Windows)
     try:
-        # Try to get the current event loop
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        # If no loop is running, create a new one
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    
-    # Run the main function in the appropriate event loop
-    loop.run_until_complete(main())
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Using uvloop event loop")
+    except ImportError:
+        pass
+
+    # asyncio.run creates the loop from the policy above and closes it on exit
+    asyncio.run(main())